@@ -4,18 +4,57 @@ Generate product events seed data with realistic user journeys.
 Users progress through funnel stages with drop-off at each step.
 """
 
+import argparse
+import contextlib
 import csv
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
 import json
+import os
 import random
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
 
-# Configuration
+try:
+    import numpy as np
+except ImportError:  # Only needed for --engine numpy
+    np = None
+
+# Configuration (--sessions, --users, --days and --end-date override these)
 NUM_SESSIONS = 10000  # Number of user sessions to generate
 NUM_USERS = 5000  # Realistic user base
+NUM_DAYS = 30  # Length of the generated window
 END_DATE = datetime.now()
-START_DATE = END_DATE - timedelta(days=30)
+START_DATE = END_DATE - timedelta(days=NUM_DAYS)
 OUTPUT_FILE = Path(__file__).parent.parent / "data" / "raw_product_events.csv"
+# Partitioned formats stay outside the dbt seed paths
+PARTITION_DIR = Path(__file__).parent.parent / "output" / "raw_product_events"
+PARTITION_MANIFEST = "_manifest.json"
+SORT_CHUNK_EVENTS = 250000  # Events held in memory before a sorted chunk is spilled to disk
+MERGE_FAN_IN = 64  # Most chunk files open at once while merging
+NUMPY_BATCH_SESSIONS = 50000  # Sessions drawn per NumPy batch
+BENCHMARK_SCALES = [1000, 10000, 100000]  # Session counts measured by --benchmark
+
+FIELDNAMES = [
+    "event_id",
+    "user_id",
+    "session_id",
+    "event_name",
+    "event_timestamp",
+    "device_type",
+    "browser",
+    "referrer",
+    "event_properties",
+]
 
 # Funnel stages in order - users progress through these sequentially
 FUNNEL_STAGES = [
@@ -181,101 +220,843 @@ def generate_session(user_id: int, session_start: datetime) -> list:
     return events
 
 
-def generate_all_events():
-    """Generate all events from user sessions."""
-    print(f"Generating events from {NUM_SESSIONS} sessions...")
+PAYMENT_METHODS = ["credit_card", "paypal", "apple_pay", "google_pay"]
+SHIPPING_METHODS = ["standard", "express", "overnight"]
+QUANTITIES = [1, 2, 3, 4, 5]
+QUANTITY_WEIGHTS = [60, 25, 10, 3, 2]
+
+
+def segment_positions(counts):
+    """Return each element's position within its segment for repeated segments."""
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.arange(starts.size) - starts
+
+
+def segment_cumsum(values, counts):
+    """Inclusive cumulative sum of values restarted at every segment."""
+    totals = np.cumsum(values)
+    before = np.concatenate(([0], totals))[np.cumsum(counts) - counts]
+    return totals - np.repeat(before, counts)
+
+
+def weighted_draws(rng, weights, size):
+    probabilities = np.asarray(weights, dtype=float)
+    return rng.choice(len(weights), size=size, p=probabilities / probabilities.sum())
 
-    all_events = []
+
+def generate_events_batch(rng, num_sessions: int) -> dict:
+    """Draw every session and event at once as NumPy columns.
+
+    Mirrors generate_session: the same funnel rates, weights and time gaps,
+    but each random draw is one array call across all sessions. Event
+    timestamps are whole seconds after START_DATE.
+    """
     date_range_seconds = int((END_DATE - START_DATE).total_seconds())
 
-    for session_num in range(NUM_SESSIONS):
-        if session_num % 500 == 0:
+    # Per-session attributes
+    user_ids = rng.integers(1, NUM_USERS + 1, size=num_sessions)
+    session_starts = rng.integers(0, date_range_seconds + 1, size=num_sessions)
+    session_ids = rng.integers(100000000, 1000000000, size=num_sessions)
+    devices = weighted_draws(rng, DEVICE_WEIGHTS, num_sessions)
+    browsers = weighted_draws(rng, BROWSER_WEIGHTS, num_sessions)
+    referrers = weighted_draws(rng, REFERRER_WEIGHTS, num_sessions)
+    products = rng.integers(0, len(PRODUCTS), size=num_sessions)
+    quantities = weighted_draws(rng, QUANTITY_WEIGHTS, num_sessions)
+    payment_methods = rng.integers(0, len(PAYMENT_METHODS), size=num_sessions)
+    shipping_methods = rng.integers(0, len(SHIPPING_METHODS), size=num_sessions)
+
+    # A session reaches stage n only if it progressed past every earlier stage
+    rates = np.array([STAGE_PROGRESSION_RATES[stage] for stage in FUNNEL_STAGES[:-1]])
+    progressed = rng.random((num_sessions, len(rates))) <= rates
+    funnel_depths = np.cumprod(progressed, axis=1).sum(axis=1)
+
+    # Browsing page views: 10 seconds to 5 minutes after each one
+    page_view_counts = rng.integers(PAGE_VIEWS_BEFORE_PRODUCT[0], PAGE_VIEWS_BEFORE_PRODUCT[1] + 1, size=num_sessions)
+    page_view_sessions = np.repeat(np.arange(num_sessions), page_view_counts)
+    page_view_gaps = rng.integers(10, 301, size=page_view_sessions.size)
+    page_view_elapsed = segment_cumsum(page_view_gaps, page_view_counts)
+    page_view_times = session_starts[page_view_sessions] + page_view_elapsed - page_view_gaps
+    browsing_seconds = np.add.reduceat(page_view_gaps, np.cumsum(page_view_counts) - page_view_counts)
+
+    # Funnel stages: 30 seconds to 10 minutes before each one
+    funnel_sessions = np.repeat(np.arange(num_sessions), funnel_depths)
+    funnel_gaps = rng.integers(30, 601, size=funnel_sessions.size)
+    funnel_times = (
+        session_starts[funnel_sessions]
+        + browsing_seconds[funnel_sessions]
+        + segment_cumsum(funnel_gaps, funnel_depths)
+    )
+
+    num_page_views = page_view_sessions.size
+    num_funnel_events = funnel_sessions.size
+    return {
+        "user_id": user_ids,
+        "session_id": session_ids,
+        "device": devices,
+        "browser": browsers,
+        "referrer": referrers,
+        "product": products,
+        "quantity": quantities,
+        "payment_method": payment_methods,
+        "shipping_method": shipping_methods,
+        "funnel_depth": funnel_depths,
+        "event_session": np.concatenate([page_view_sessions, funnel_sessions]),
+        "event_stage": np.concatenate([
+            np.zeros(num_page_views, dtype=np.int64),
+            segment_positions(funnel_depths) + 1,
+        ]),
+        "event_seconds": np.concatenate([page_view_times, funnel_times]),
+        "page": np.concatenate([
+            rng.integers(0, len(PAGES), size=num_page_views),
+            np.full(num_funnel_events, -1),
+        ]),
+        "time_on_page": np.concatenate([
+            rng.integers(5, 301, size=num_page_views),
+            np.zeros(num_funnel_events, dtype=np.int64),
+        ]),
+        "view_duration": np.concatenate([
+            np.zeros(num_page_views, dtype=np.int64),
+            rng.integers(10, 181, size=num_funnel_events),
+        ]),
+    }
+
+
+def stage_properties(stage: str, product: int, quantity: int, payment_method: int, shipping_method: int) -> dict:
+    """Build event_properties as generate_event_properties does, with 0 for per-event durations."""
+    product = PRODUCTS[product]
+    quantity = QUANTITIES[quantity]
+    cart_total = round(product["price"] * quantity, 2)
+    payment_method = PAYMENT_METHODS[payment_method]
+
+    if stage == "product_viewed":
+        return {
+            "product_id": product["id"],
+            "product_name": product["name"],
+            "product_category": product["category"],
+            "product_price": product["price"],
+            "view_duration_seconds": 0,
+        }
+    if stage == "add_to_cart":
+        return {
+            "product_id": product["id"],
+            "product_name": product["name"],
+            "product_price": product["price"],
+            "quantity": quantity,
+            "cart_total": cart_total,
+        }
+    if stage == "checkout_started":
+        return {"cart_item_count": quantity, "cart_total": cart_total}
+    if stage == "payment_info_entered":
+        return {"payment_method": payment_method}
+    return {
+        "order_total": cart_total,
+        "item_count": quantity,
+        "payment_method": payment_method,
+        "shipping_method": SHIPPING_METHODS[shipping_method],
+    }
+
+
+def property_templates() -> tuple:
+    """Pre-render every event_properties string a batch event can have.
+
+    Returns the template strings and, per funnel stage, the index of its
+    first template. Page views and product views end in a per-event
+    duration, so their templates stop just before it and the duration and
+    closing brace are appended per event. Every other stage's properties
+    are fixed by the session's product, quantity, payment and shipping
+    method, so one template per combination covers them.
+    """
+    templates = [json.dumps({"page_url": page, "time_on_page_seconds": 0})[:-2] for page in PAGES]
+    offsets = {"page_view": 0}
+    for stage in FUNNEL_STAGES[1:]:
+        offsets[stage] = len(templates)
+        for product, quantity, payment_method, shipping_method in itertools.product(
+            range(len(PRODUCTS)), range(len(QUANTITIES)), range(len(PAYMENT_METHODS)), range(len(SHIPPING_METHODS))
+        ):
+            if stage == "product_viewed" and (quantity, payment_method, shipping_method) != (0, 0, 0):
+                continue
+            if stage in ("add_to_cart", "checkout_started") and (payment_method, shipping_method) != (0, 0):
+                continue
+            if stage == "payment_info_entered" and (product, quantity, shipping_method) != (0, 0, 0):
+                continue
+            text = json.dumps(stage_properties(stage, product, quantity, payment_method, shipping_method))
+            templates.append(text[:-2] if stage == "product_viewed" else text)
+    return templates, offsets
+
+
+def batch_rows(batch: dict, templates: list, offsets: dict) -> list:
+    """Turn a generate_events_batch batch into CSV rows, one column at a time.
+
+    Every column is gathered from per-session values or pre-rendered lookup
+    tables with NumPy indexing, so no Python code runs per event until the
+    columns are zipped into row tuples. templates and offsets come from
+    property_templates.
+    """
+    sessions = batch["event_session"]
+    stages = batch["event_stage"]
+    product = batch["product"][sessions]
+    quantity = batch["quantity"][sessions]
+    payment_method = batch["payment_method"][sessions]
+    shipping_method = batch["shipping_method"][sessions]
+    num_quantities = len(QUANTITIES)
+
+    # Template index per stage, in the itertools.product order property_templates uses
+    template_ids = np.select(
+        [stages == FUNNEL_STAGES.index(stage) for stage in FUNNEL_STAGES],
+        [
+            batch["page"],
+            offsets["product_viewed"] + product,
+            offsets["add_to_cart"] + product * num_quantities + quantity,
+            offsets["checkout_started"] + product * num_quantities + quantity,
+            offsets["payment_info_entered"] + payment_method,
+            offsets["checkout_completed"]
+            + ((product * num_quantities + quantity) * len(PAYMENT_METHODS) + payment_method) * len(SHIPPING_METHODS)
+            + shipping_method,
+        ],
+    )
+    properties = np.array(templates, dtype=object)[template_ids]
+    durations = np.where(stages == 0, batch["time_on_page"], batch["view_duration"])
+    timed = stages <= FUNNEL_STAGES.index("product_viewed")
+    duration_suffixes = np.array([f"{seconds}}}" for seconds in range(int(durations.max(initial=0)) + 1)], dtype=object)
+    properties[timed] += duration_suffixes[durations[timed]]
+
+    # "YYYY-MM-DDTHH:MM:SS" -> "YYYY-MM-DD HH:MM:SS" by overwriting the T in place
+    timestamps = np.datetime_as_string(
+        np.datetime64(START_DATE, "s") + batch["event_seconds"].astype("timedelta64[s]"),
+        unit="s",
+    )
+    characters = timestamps.view("U1").reshape(timestamps.size, -1)
+    characters[:, 10] = " "
+
+    session_labels = np.array([f"sess_{session_id}" for session_id in batch["session_id"].tolist()], dtype=object)
+    return list(zip(
+        batch["user_id"][sessions].tolist(),
+        session_labels[sessions].tolist(),
+        np.array(FUNNEL_STAGES, dtype=object)[stages].tolist(),
+        timestamps.tolist(),
+        np.array(DEVICES, dtype=object)[batch["device"][sessions]].tolist(),
+        np.array(BROWSERS, dtype=object)[batch["browser"][sessions]].tolist(),
+        np.array(REFERRERS, dtype=object)[batch["referrer"][sessions]].tolist(),
+        properties.tolist(),
+    ))
+
+
+def event_row(event: dict) -> tuple:
+    """Flatten a generate_session event into a CSV row without its event_id."""
+    return (
+        event["user_id"],
+        event["session_id"],
+        event["event_name"],
+        event["event_timestamp"].strftime("%Y-%m-%d %H:%M:%S"),
+        event["device_type"],
+        event["browser"],
+        event["referrer"],
+        json.dumps(event["event_properties"]),
+    )
+
+
+def row_timestamp(row) -> str:
+    # "%Y-%m-%d %H:%M:%S" strings sort chronologically
+    return row[3]
+
+
+def python_sessions(num_sessions: int, progress: bool = True):
+    """Lazily yield the events of one generate_session session at a time."""
+    date_range_seconds = int((END_DATE - START_DATE).total_seconds())
+
+    for session_num in range(num_sessions):
+        if progress and session_num % 500 == 0:
             print(f"  Generated {session_num} sessions...")
 
         user_id = random.randint(1, NUM_USERS)
         session_start = START_DATE + timedelta(seconds=random.randint(0, date_range_seconds))
 
-        session_events = generate_session(user_id, session_start)
-        all_events.extend(session_events)
+        yield generate_session(user_id, session_start)
+
+
+def python_event_blocks(num_sessions: int, progress: bool = True):
+    """Lazily yield the event rows of one session at a time."""
+    for session in python_sessions(num_sessions, progress):
+        yield [event_row(event) for event in session]
+
+
+def numpy_batches(num_sessions: int, seed: int, progress: bool = True):
+    """Lazily yield generate_events_batch batches of NUMPY_BATCH_SESSIONS sessions."""
+    if np is None:
+        raise SystemExit("--engine numpy requires numpy (pip install numpy)")
+    rng = np.random.default_rng(seed)
+
+    for batch_start in range(0, num_sessions, NUMPY_BATCH_SESSIONS):
+        if progress:
+            print(f"  Generated {batch_start} sessions...")
+        yield generate_events_batch(rng, min(NUMPY_BATCH_SESSIONS, num_sessions - batch_start))
+
+
+def numpy_event_blocks(num_sessions: int, seed: int, progress: bool = True):
+    """Lazily yield the event rows of NUMPY_BATCH_SESSIONS sessions at a time."""
+    batches = numpy_batches(num_sessions, seed, progress)
+    templates, offsets = property_templates()
+    for batch in batches:
+        yield batch_rows(batch, templates, offsets)
+
+
+def sorted_chunks(blocks, funnel_counts: Counter):
+    """Buffer event rows into time-sorted chunks, counting funnel stages as they pass.
+
+    At most SORT_CHUNK_EVENTS rows are held in memory however many
+    sessions are generated.
+    """
+    buffer = []
+    for block in blocks:
+        funnel_counts.update(row[2] for row in block)
+        buffer.extend(block)
+        if len(buffer) >= SORT_CHUNK_EVENTS:
+            buffer.sort(key=row_timestamp)
+            yield buffer
+            buffer = []
+    if buffer:
+        buffer.sort(key=row_timestamp)
+        yield buffer
+
+
+def configure(num_sessions: int, num_users: int, start_date: datetime, end_date: datetime):
+    """Set the scale and date window, also in worker processes that re-import this module."""
+    global NUM_SESSIONS, NUM_USERS, START_DATE, END_DATE
+    NUM_SESSIONS, NUM_USERS, START_DATE, END_DATE = num_sessions, num_users, start_date, end_date
+
+
+def configuration() -> tuple:
+    return NUM_SESSIONS, NUM_USERS, START_DATE, END_DATE
 
-    # Sort by timestamp and assign event IDs
-    all_events.sort(key=lambda e: e["event_timestamp"])
-    for i, event in enumerate(all_events):
-        event["event_id"] = i + 1
-        event["event_timestamp"] = event["event_timestamp"].strftime("%Y-%m-%d %H:%M:%S")
-        event["event_properties"] = json.dumps(event["event_properties"])
 
-    print(f"  Total events generated: {len(all_events)}")
-    return all_events
+def derive_seed(seed: int, *parts) -> int:
+    digest = hashlib.sha256(":".join(str(part) for part in (seed, *parts)).encode()).digest()
+    return int.from_bytes(digest[:8], "big")
 
 
-def write_csv(events):
-    """Write events to CSV file."""
-    print(f"Writing to {OUTPUT_FILE}...")
+def shard_seed(seed: int, shard: int) -> int:
+    """Derive a shard's seed from the base seed; shard 0 keeps the base seed."""
+    if shard == 0:
+        return seed
+    return derive_seed(seed, shard)
 
-    OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
 
-    fieldnames = [
-        "event_id",
-        "user_id",
-        "session_id",
-        "event_name",
-        "event_timestamp",
-        "device_type",
-        "browser",
-        "referrer",
-        "event_properties",
+def shard_sizes(num_sessions: int, workers: int) -> list:
+    return [num_sessions // workers + (shard < num_sessions % workers) for shard in range(workers)]
+
+
+def generate_shard(engine: str, num_sessions: int, seed: int, chunk_dir: str):
+    """Generate one shard into sorted chunk files under chunk_dir.
+
+    Runs in a worker process when --workers is above 1. Returns the chunk
+    paths in order and the shard's funnel counts.
+    """
+    if engine == "numpy":
+        blocks = numpy_event_blocks(num_sessions, seed)
+    else:
+        random.seed(seed)
+        blocks = python_event_blocks(num_sessions)
+
+    funnel_counts = Counter()
+    return spill_chunks(blocks, funnel_counts, chunk_dir), funnel_counts
+
+
+def spill_chunks(blocks, funnel_counts: Counter, chunk_dir: str) -> list:
+    """Write sorted_chunks to chunk files under chunk_dir and return their paths in order."""
+    chunk_paths = []
+    for chunk in sorted_chunks(blocks, funnel_counts):
+        with tempfile.NamedTemporaryFile("w", newline="", dir=chunk_dir, delete=False) as chunk_file:
+            csv.writer(chunk_file).writerows(chunk)
+        chunk_paths.append(chunk_file.name)
+    return chunk_paths
+
+
+def read_chunk(chunk_path: str):
+    with open(chunk_path, newline="") as chunk_file:
+        yield from csv.reader(chunk_file)
+
+
+def merge_chunks(chunk_paths: list, chunk_dir: str):
+    """Merge sorted chunk files into one timestamp-ordered stream of rows.
+
+    Runs of MERGE_FAN_IN consecutive chunks are merged into intermediate
+    chunk files until the rest fit in a single merge, so no more than
+    MERGE_FAN_IN files are open however many chunks there are. Merged
+    chunks are deleted as they are consumed. heapq.merge is stable and
+    runs keep their order, so ties come out as a single merge would
+    order them.
+    """
+    while len(chunk_paths) > MERGE_FAN_IN:
+        merged_paths = []
+        for run_start in range(0, len(chunk_paths), MERGE_FAN_IN):
+            run = chunk_paths[run_start:run_start + MERGE_FAN_IN]
+            with tempfile.NamedTemporaryFile("w", newline="", dir=chunk_dir, delete=False) as chunk_file:
+                csv.writer(chunk_file).writerows(heapq.merge(*(read_chunk(path) for path in run), key=row_timestamp))
+            for path in run:
+                os.unlink(path)
+            merged_paths.append(chunk_file.name)
+        chunk_paths = merged_paths
+    return heapq.merge(*(read_chunk(path) for path in chunk_paths), key=row_timestamp)
+
+
+def generate_all_events(engine: str, seed: int, workers: int, chunk_dir: str, first_event_id: int = 1):
+    """Generate all events as a timestamp-ordered stream.
+
+    Sessions are split into one shard per worker, each with its own seed
+    derived from the base seed. Every shard is generated lazily and sorted
+    in bounded chunks spilled to chunk_dir, and the chunks are then merged
+    by event_timestamp (see merge_chunks). Ties break in shard and chunk
+    order, so the output only depends on the seed and the shard count.
+    Returns the stream of CSV rows, with event IDs counting up from
+    first_event_id, and the funnel counts.
+    """
+    print(f"Generating events from {NUM_SESSIONS} sessions in {workers} shard(s)...")
+
+    shards = [
+        (engine, size, shard_seed(seed, shard), chunk_dir)
+        for shard, size in enumerate(shard_sizes(NUM_SESSIONS, workers))
     ]
+    if workers == 1:
+        results = [generate_shard(*shards[0])]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=configure,
+            initargs=configuration(),
+        ) as executor:
+            results = list(executor.map(generate_shard, *zip(*shards)))
+
+    funnel_counts = Counter()
+    chunk_paths = []
+    for shard_chunk_paths, shard_funnel_counts in results:
+        chunk_paths.extend(shard_chunk_paths)
+        funnel_counts.update(shard_funnel_counts)
+    print(f"  Total events generated: {sum(funnel_counts.values())}")
 
-    with open(OUTPUT_FILE, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
+    merged = merge_chunks(chunk_paths, chunk_dir)
+    events = ((event_id, *row) for event_id, row in enumerate(merged, start=first_event_id))
+    return events, funnel_counts
+
+
+def read_last_event(path: Path):
+    """Return the event_id and event_timestamp of the last row in path.
+
+    Reads backwards from the end of the file, so the cost does not grow
+    with the file. Returns None when there is no file or no event rows.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        position = f.seek(0, os.SEEK_END)
+        tail = b""
+        while position > 0 and b"\n" not in tail.rstrip(b"\r\n"):
+            step = min(64 * 1024, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+    last_line = tail.rstrip(b"\r\n").rsplit(b"\n", 1)[-1].decode()
+    row = next(csv.reader([last_line]), None)
+    if not row or row[0] == FIELDNAMES[0]:
+        return None
+    timestamp = row[FIELDNAMES.index("event_timestamp")]
+    return int(row[0]), datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+
+
+def write_csv(events, append: bool = False, output_file: Path = OUTPUT_FILE):
+    """Write events to CSV file, or add them after its existing rows."""
+    print(f"{'Appending' if append else 'Writing'} to {output_file}...")
+
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(output_file, "a" if append else "w", newline="") as f:
+        writer = csv.writer(f)
+        if not append:
+            writer.writerow(FIELDNAMES)
         writer.writerows(events)
 
-    print(f"Done! Created {OUTPUT_FILE}")
+    print(f"Done! {'Appended to' if append else 'Created'} {output_file}")
 
 
-def print_funnel_stats(events):
-    """Print funnel conversion stats."""
-    print("\nFunnel stats by session:")
+# JSON Lines keys are encoded once; event_properties is already JSON and is embedded as-is
+JSONL_KEYS = [json.dumps(name) + ": " for name in FIELDNAMES]
 
-    sessions = {}
-    for e in events:
-        sid = e["session_id"]
-        if sid not in sessions:
-            sessions[sid] = set()
-        # Parse event_name from the event (it's still the raw value before JSON dump)
-        sessions[sid].add(e["event_name"])
 
-    for stage in FUNNEL_STAGES:
-        count = sum(1 for s in sessions.values() if stage in s)
-        pct = count / len(sessions) * 100
-        print(f"  {stage}: {count} sessions ({pct:.1f}%)")
+def jsonl_line(row) -> str:
+    event_id, user_id, *strings, event_properties = row
+    values = [str(event_id), str(user_id), *(json.dumps(value) for value in strings), event_properties]
+    return "{" + ", ".join(key + value for key, value in zip(JSONL_KEYS, values)) + "}\n"
 
 
-def main():
-    random.seed(42)  # For reproducibility
-    events = generate_all_events()
+def read_manifest(output_dir: Path):
+    try:
+        return json.loads((output_dir / PARTITION_MANIFEST).read_text())
+    except FileNotFoundError:
+        return None
 
-    # Print stats before converting to CSV format
-    events_for_stats = [
-        {**e, "event_name": e["event_name"]}
-        for e in events
-    ]
 
-    # Temporarily store event_name before JSON conversion for stats
-    event_names = {e["session_id"]: set() for e in events}
-    for e in events:
-        event_names[e["session_id"]].add(e["event_name"])
+def read_last_partitioned_event(output_dir: Path, file_format: str):
+    """Return the event_id and event_timestamp of the last event listed in the manifest."""
+    manifest = read_manifest(output_dir)
+    if not manifest or not manifest["partitions"]:
+        return None
+    if manifest["format"] != file_format:
+        raise SystemExit(f"{output_dir} holds {manifest['format']} partitions, not {file_format}")
+    last = manifest["partitions"][-1]
+    return last["last_event_id"], datetime.strptime(last["last_event_timestamp"], "%Y-%m-%d %H:%M:%S")
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
 
+def write_partitions(events, output_dir: Path, file_format: str, append: bool = False):
+    """Write events as one gzip-compressed file per event_date, plus a manifest.
+
+    Files go to event_date=YYYY-MM-DD/part-NNNNN.<format>. Events arrive in
+    timestamp order, so only one partition is open at a time. Appending
+    adds a new part file rather than rewriting an existing one, and gzip
+    mtime is fixed, so a day's files and manifest hashes only change when
+    its events do.
+    """
+    print(f"{'Appending' if append else 'Writing'} {file_format} partitions to {output_dir}...")
+
+    manifest = read_manifest(output_dir) if append else None
+    if manifest and manifest["format"] != file_format:
+        raise SystemExit(f"{output_dir} holds {manifest['format']} partitions, not {file_format}")
+    if not manifest:
+        for stale in output_dir.glob("event_date=*/part-*"):
+            stale.unlink()
+        manifest = {"format": file_format, "partitions": []}
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    parts_per_date = Counter(partition["event_date"] for partition in manifest["partitions"])
+    for event_date, rows in itertools.groupby(events, key=lambda row: row[4][:10]):
+        relative_path = Path(f"event_date={event_date}") / f"part-{parts_per_date[event_date]:05d}.{file_format}"
+        parts_per_date[event_date] += 1
+        path = output_dir / relative_path
+        path.parent.mkdir(exist_ok=True)
+
+        first_row = last_row = None
+        num_rows = 0
+        with gzip.GzipFile(path, "wb", mtime=0) as compressed:
+            with io.TextIOWrapper(compressed, encoding="utf-8", newline="") as f:
+                if file_format == "csv.gz":
+                    writer = csv.writer(f)
+                    writer.writerow(FIELDNAMES)
+                for row in rows:
+                    if file_format == "csv.gz":
+                        writer.writerow(row)
+                    else:
+                        f.write(jsonl_line(row))
+                    first_row = first_row or row
+                    last_row = row
+                    num_rows += 1
+
+        manifest["partitions"].append({
+            "event_date": event_date,
+            "path": relative_path.as_posix(),
+            "rows": num_rows,
+            "bytes": path.stat().st_size,
+            "sha256": file_sha256(path),
+            "first_event_id": first_row[0],
+            "last_event_id": last_row[0],
+            "last_event_timestamp": last_row[4],
+        })
+
+    manifest_path = output_dir / PARTITION_MANIFEST
+    temporary_path = manifest_path.with_suffix(".tmp")
+    temporary_path.write_text(json.dumps(manifest, indent=2) + "\n")
+    os.replace(temporary_path, manifest_path)
+
+    print(f"Done! Wrote {len(manifest['partitions'])} partition files listed in {manifest_path}")
+
+
+def print_funnel_stats(funnel_counts: Counter, total_sessions: int):
+    """Print funnel conversion stats."""
     print("\nFunnel stats by session:")
-    total_sessions = len(event_names)
+
     for stage in FUNNEL_STAGES:
-        count = sum(1 for stages in event_names.values() if stage in stages)
+        # Every session starts with page views; later stages happen at most once per session
+        count = total_sessions if stage == "page_view" else funnel_counts[stage]
         pct = count / total_sessions * 100
         print(f"  {stage}: {count} sessions ({pct:.1f}%)")
 
-    write_csv(events)
+
+def reset_peak_rss() -> bool:
+    """Start a new peak RSS measurement, where the platform allows it (Linux)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def maxrss_mb(who: int) -> float:
+    """getrusage(who).ru_maxrss in MB; it is in bytes on macOS and in kilobytes elsewhere."""
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS since the last reset_peak_rss, else over the process lifetime."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return maxrss_mb(resource.RUSAGE_SELF)
+
+
+def output_bytes(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def write_output(events, file_format: str, output_dir: Path):
+    """Write events as main does, into output_dir, without progress messages."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        if file_format == "csv":
+            write_csv(events, output_file=output_dir / OUTPUT_FILE.name)
+        else:
+            write_partitions(events, output_dir, file_format)
+
+
+def benchmark_phases(engine: str, seed: int, num_sessions: int, file_format: str) -> list:
+    """Time each phase of one single-shard generation run, in a fresh process per scale.
+
+    generate draws the events, serialise renders them as rows (timestamps
+    and event_properties JSON), sort spills sorted chunk files and merges
+    them, and write encodes and writes the --format output. Each phase keeps
+    its whole output in memory so it can be measured on its own; the
+    normal run streams them together. Peak RSS is per phase where
+    reset_peak_rss works, and cumulative otherwise.
+    """
+    phases = []
+    per_phase_rss = reset_peak_rss()
+    started = time.perf_counter()
+
+    def record(phase, num_events, num_bytes=None):
+        nonlocal started
+        elapsed = time.perf_counter() - started
+        phases.append({
+            "phase": phase,
+            "events": num_events,
+            "seconds": elapsed,
+            "bytes": num_bytes,
+            "peak_rss_mb": peak_rss_mb(),
+            "per_phase_rss": per_phase_rss,
+        })
+        reset_peak_rss()
+        started = time.perf_counter()
+
+    if engine == "numpy":
+        raw = list(numpy_batches(num_sessions, seed, progress=False))
+        num_events = sum(batch["event_session"].size for batch in raw)
+    else:
+        random.seed(seed)
+        raw = list(python_sessions(num_sessions, progress=False))
+        num_events = sum(len(session) for session in raw)
+    record("generate", num_events)
+
+    if engine == "numpy":
+        templates, offsets = property_templates()
+        blocks = [batch_rows(batch, templates, offsets) for batch in raw]
+    else:
+        blocks = [[event_row(event) for event in session] for session in raw]
+    del raw
+    record("serialise", num_events)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        chunk_dir = Path(work_dir) / "chunks"
+        chunk_dir.mkdir()
+        chunk_paths = spill_chunks(blocks, Counter(), str(chunk_dir))
+        del blocks
+        spilled = sum(os.path.getsize(path) for path in chunk_paths)
+        events = [(event_id, *row) for event_id, row in enumerate(merge_chunks(chunk_paths, str(chunk_dir)), start=1)]
+        record("sort", len(events), spilled)
+
+        output_dir = Path(work_dir) / "output"
+        write_output(events, file_format, output_dir)
+        record("write", len(events), output_bytes(output_dir))
+    return phases
+
+
+def benchmark_total(engine: str, seed: int, num_sessions: int, workers: int, file_format: str) -> dict:
+    """Time a whole streamed run as main does it, with --workers shards, in a fresh process."""
+    configure(num_sessions, NUM_USERS, START_DATE, END_DATE)
+    reset_peak_rss()
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_dir = Path(work_dir) / "output"
+        with contextlib.redirect_stdout(io.StringIO()):
+            events, funnel_counts = generate_all_events(engine, seed, workers, work_dir)
+        write_output(events, file_format, output_dir)
+        num_bytes = output_bytes(output_dir)
+    return {
+        "phase": "total",
+        "events": sum(funnel_counts.values()),
+        "seconds": time.perf_counter() - started,
+        "bytes": num_bytes,
+        # With --workers above 1 most of the work runs in the shard processes
+        "peak_rss_mb": max(peak_rss_mb(), maxrss_mb(resource.RUSAGE_CHILDREN)),
+        "per_phase_rss": True,
+    }
+
+
+def run_benchmark(engine: str, seed: int, scales: list, workers: int, file_format: str):
+    """Print events/s, bytes/s written and peak RSS for each phase at each scale.
+
+    The phases run in a single shard; the total row is a normal streamed
+    run with --workers shards writing --format output.
+    """
+    print(
+        f"Benchmarking the {engine} engine at {', '.join(str(scale) for scale in scales)} sessions"
+        f" ({workers} worker(s), {file_format})..."
+    )
+    print(f"{'sessions':>10} {'phase':<10} {'events':>10} {'seconds':>9} {'events/s':>12} {'MB/s':>9} {'peak RSS MB':>11}")
+
+    cumulative = False
+    for num_sessions in scales:
+        # A new process per measurement keeps each peak RSS independent of earlier ones
+        with ProcessPoolExecutor(max_workers=1, initializer=configure, initargs=configuration()) as executor:
+            phases = executor.submit(benchmark_phases, engine, seed, num_sessions, file_format).result()
+        with ProcessPoolExecutor(max_workers=1, initializer=configure, initargs=configuration()) as executor:
+            phases.append(executor.submit(benchmark_total, engine, seed, num_sessions, workers, file_format).result())
+        for phase in phases:
+            seconds = max(phase["seconds"], 1e-9)
+            throughput = "-" if phase["bytes"] is None else f"{phase['bytes'] / seconds / 1e6:.1f}"
+            marker = "" if phase["per_phase_rss"] else "*"
+            cumulative = cumulative or not phase["per_phase_rss"]
+            print(
+                f"{num_sessions:>10} {phase['phase']:<10} {phase['events']:>10} {seconds:>9.3f}"
+                f" {phase['events'] / seconds:>12,.0f} {throughput:>9} {phase['peak_rss_mb']:>11.1f}{marker}"
+            )
+    print("MB/s is chunk files spilled for sort and output written for write and total.")
+    if cumulative:
+        print("* peak RSS since the process started; this platform cannot reset it per phase.")
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return number
+
+
+def local_datetime(value: str) -> datetime:
+    """Parse an ISO date or datetime as naive local time, like the default datetime.now().
+
+    Event timestamps carry no offset, so an aware value is converted to
+    local time rather than compared with them directly.
+    """
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error)) from error
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--engine",
+        choices=["python", "numpy"],
+        default="python",
+        help="python draws each session in turn; numpy draws sessions in batches",
+    )
+    parser.add_argument(
+        "--workers",
+        type=positive_int,
+        default=1,
+        help="number of shards generated in parallel processes; output is reproducible per shard count",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="base random seed")
+    parser.add_argument("--sessions", type=positive_int, default=NUM_SESSIONS, help="number of sessions to generate")
+    parser.add_argument("--users", type=positive_int, default=NUM_USERS, help="number of distinct users")
+    parser.add_argument("--days", type=positive_int, default=NUM_DAYS, help="length of the generated window in days")
+    parser.add_argument(
+        "--end-date",
+        type=local_datetime,
+        default=END_DATE,
+        help="end of the generated window as an ISO date or datetime, in local time unless it has an offset (default: now)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["csv", "csv.gz", "jsonl.gz"],
+        default="csv",
+        help="csv writes the single seed file; csv.gz and jsonl.gz write gzip-compressed day partitions",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=PARTITION_DIR,
+        help="directory for the partitioned formats",
+    )
+    parser.add_argument(
+        "--append",
+        action="store_true",
+        help="only generate events after the last one in the existing file and append them",
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="measure each phase and a whole --workers/--format run at --benchmark-scales instead of writing output",
+    )
+    parser.add_argument(
+        "--benchmark-scales",
+        type=lambda value: [positive_int(scale) for scale in value.split(",")],
+        default=BENCHMARK_SCALES,
+        help="comma-separated session counts for --benchmark",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    window = timedelta(days=args.days)
+    configure(args.sessions, args.users, args.end_date - window, args.end_date)
+    if args.benchmark:
+        run_benchmark(args.engine, args.seed, args.benchmark_scales, args.workers, args.format)
+        return
+
+    seed = args.seed
+    first_event_id = 1
+    partitioned = args.format != "csv"
+    last_event = None
+    if args.append and partitioned:
+        last_event = read_last_partitioned_event(args.output_dir, args.format)
+    elif args.append:
+        last_event = read_last_event(OUTPUT_FILE)
+    if last_event:
+        last_event_id, last_timestamp = last_event
+        start_date = last_timestamp + timedelta(seconds=1)
+        # Keep the session rate of a full --days window over the shorter new period
+        num_sessions = max(0, round(args.sessions * ((args.end_date - start_date) / window)))
+        if num_sessions == 0:
+            print(f"Events already cover the period up to {args.end_date}; nothing to append")
+            return
+        configure(num_sessions, args.users, start_date, args.end_date)
+        seed = derive_seed(args.seed, "append", last_event_id)
+        first_event_id = last_event_id + 1
+        print(f"Appending events after event {last_event_id} at {last_timestamp}...")
+
+    with tempfile.TemporaryDirectory() as chunk_dir:
+        events, funnel_counts = generate_all_events(args.engine, seed, args.workers, chunk_dir, first_event_id)
+        print_funnel_stats(funnel_counts, NUM_SESSIONS)
+        if partitioned:
+            write_partitions(events, args.output_dir, args.format, append=last_event is not None)
+        else:
+            write_csv(events, append=last_event is not None)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,15 @@
 #!/usr/bin/env python3
 import argparse
+import concurrent.futures
+import contextlib
+import fcntl
+import hashlib
 import json
+import os
 import re
+import stat
+import sys
+import tempfile
 from pathlib import Path
 
 
@@ -29,6 +37,99 @@ def json_value(data, keys):
     return value
 
 
+JSON_DECODER = json.JSONDecoder()
+JSON_WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+
+
+def skip_json_whitespace(text, position):
+    return JSON_WHITESPACE_RE.match(text, position).end()
+
+
+def json_member_start(text, position, key):
+    found = None
+    position = skip_json_whitespace(text, position + 1)
+    if text.startswith('}', position):
+        return found, position + 1
+    while True:
+        if not text.startswith('"', position):
+            raise json.JSONDecodeError('Expecting property name enclosed in double quotes', text, position)
+        member, position = json.decoder.scanstring(text, position + 1)
+        position = skip_json_whitespace(text, position)
+        if not text.startswith(':', position):
+            raise json.JSONDecodeError("Expecting ':' delimiter", text, position)
+        position = skip_json_whitespace(text, position + 1)
+        if member == key:
+            found = position
+        _, position = JSON_DECODER.raw_decode(text, position)
+        position = skip_json_whitespace(text, position)
+        if text.startswith(',', position):
+            position = skip_json_whitespace(text, position + 1)
+        elif text.startswith('}', position):
+            return found, position + 1
+        else:
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, position)
+
+
+def json_string_span(text, keys):
+    position = skip_json_whitespace(text, 0)
+    if not text.startswith('{', position):
+        _, end = JSON_DECODER.raw_decode(text, position)
+        if skip_json_whitespace(text, end) != len(text):
+            raise json.JSONDecodeError('Extra data', text, end)
+        raise ValueError(f'path component not found: {keys[0]}')
+    for depth, key in enumerate(keys):
+        if not text.startswith('{', position):
+            raise ValueError(f'path component not found: {key}')
+        found, end = json_member_start(text, position, key)
+        if depth == 0 and skip_json_whitespace(text, end) != len(text):
+            raise json.JSONDecodeError('Extra data', text, end)
+        if found is None:
+            raise ValueError(f'path component not found: {key}')
+        position = found
+    if not text.startswith('"', position):
+        raise ValueError('bump_target value must be a string')
+    value, end = json.decoder.scanstring(text, position + 1)
+    return position, end, value
+
+
+@contextlib.contextmanager
+def locked_directory(directory):
+    descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        fcntl.flock(descriptor, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(descriptor)
+
+
+def atomic_write(file_path, data, mode=None):
+    descriptor, temporary = tempfile.mkstemp(
+        dir=file_path.parent,
+        prefix=f'.{file_path.name}.',
+        suffix='.tmp',
+    )
+    try:
+        with os.fdopen(descriptor, 'wb') as handle:
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+        if mode is not None:
+            os.chmod(temporary, mode)
+        else:
+            with contextlib.suppress(FileNotFoundError):
+                os.chmod(temporary, stat.S_IMODE(file_path.stat().st_mode))
+        os.replace(temporary, file_path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(temporary)
+        raise
+
+
+def check_expected(current, expected):
+    if expected is not None and current != expected:
+        raise ValueError(f'bump_target value is {current!r}, expected {expected!r}')
+
+
 def yaml_scalar_parts(raw_value):
     stripped = raw_value.strip()
     if not stripped:
@@ -73,12 +174,17 @@ def yaml_scalar_parts(raw_value):
     return stripped, '', ''
 
 
-def find_yaml_value(lines, keys, replacement=None):
+YAML_KEY_RE = re.compile(r'^(?P<indent> *)(?P<quote>["\']?)(?P<key>[^"\':]+)(?P=quote):(?P<space> *)(?P<value>.*)$')
+YAML_BLOCK_SCALAR_RE = re.compile(r'[>|][0-9+-]*')
+YAML_INDEX_VERSION = 2
+
+
+def index_yaml(lines):
+    names = {}
+    records = []
     stack = []
-    matcher = re.compile(r'^(?P<indent> *)(?P<quote>["\']?)(?P<key>[^"\':]+)(?P=quote):(?P<space> *)(?P<value>.*)$')
-    found = None
     block_scalar_indent = None
-    for index, line in enumerate(lines):
+    for line_number, line in enumerate(lines):
         content = line.rstrip('\n')
         indent = len(content) - len(content.lstrip())
         if block_scalar_indent is not None:
@@ -87,34 +193,148 @@ def find_yaml_value(lines, keys, replacement=None):
             block_scalar_indent = None
         if content.lstrip().startswith('#'):
             continue
-        match = matcher.match(content)
+        match = YAML_KEY_RE.match(content)
         if not match:
             continue
         indent = len(match.group('indent'))
         while stack and indent <= stack[-1][0]:
             stack.pop()
         key = match.group('key').strip()
-        current_path = [item[1] for item in stack] + [key]
-        raw_value = match.group('value')
-        if current_path == keys:
-            if re.fullmatch(r'[>|][0-9+-]*', raw_value.strip()):
-                raise ValueError('bump_target must point to a scalar on the same line')
-            value, quote, trailing = yaml_scalar_parts(raw_value)
-            if found is not None:
-                raise ValueError('bump_target YAML path is duplicated')
-            found = (index, line, match, value, quote, trailing)
-            continue
-        if re.fullmatch(r'[>|][0-9+-]*', raw_value.strip()):
+        records.extend((
+            stack[-1][1] if stack else -1,
+            names.setdefault(key, len(names)),
+            line_number,
+            match.start('value'),
+        ))
+        raw_value = match.group('value').strip()
+        if YAML_BLOCK_SCALAR_RE.fullmatch(raw_value):
             block_scalar_indent = indent
+        elif not raw_value:
+            stack.append((indent, len(records) // 4 - 1))
+    return list(names), records
+
+
+def yaml_paths(index):
+    names, records = index
+    paths = []
+    occurrences = {}
+    for parent, name, line_number, offset in zip(*(records[field::4] for field in range(4))):
+        path = (paths[parent] if parent >= 0 else ()) + (names[name],)
+        paths.append(path)
+        occurrences.setdefault(path, []).append((line_number, offset))
+    return occurrences
+
+
+def yaml_locations(index, keys):
+    names, records = index
+    ids = {name: position for position, name in enumerate(names)}
+    if any(key not in ids for key in keys):
+        return []
+    wanted = [ids[key] for key in keys]
+    wanted_ids = set(wanted)
+    name_ids = records[1::4]
+    last = len(keys) - 1
+    depths = {}
+    found = []
+    for position in [position for position, name in enumerate(name_ids) if name in wanted_ids]:
+        parent = records[position * 4]
+        depth = 0 if parent < 0 else depths.get(parent, -2) + 1
+        if depth < 0 or name_ids[position] != wanted[depth]:
             continue
-        if not raw_value.strip():
-            stack.append((indent, key))
-    if found is None:
+        if depth == last:
+            found.append((records[position * 4 + 2], records[position * 4 + 3]))
+        else:
+            depths[position] = depth
+    return found
+
+
+def yaml_entry(lines, location):
+    line_number, offset = location
+    content = lines[line_number].rstrip('\n')
+    raw_value = content[offset:]
+    entry = {'line': line_number, 'prefix': content[:offset]}
+    if YAML_BLOCK_SCALAR_RE.fullmatch(raw_value.strip()):
+        entry['error'] = 'bump_target must point to a scalar on the same line'
+        return entry
+    try:
+        entry['value'], entry['quote'], entry['trailing'] = yaml_scalar_parts(raw_value)
+    except ValueError as error:
+        entry['error'] = str(error)
+    return entry
+
+
+def yaml_index_entry(lines, index, keys):
+    occurrences = yaml_locations(index, keys)
+    if not occurrences:
         raise ValueError('bump_target YAML path was not found')
-    index, line, match, value, quote, trailing = found
+    for position, location in enumerate(occurrences):
+        entry = yaml_entry(lines, location)
+        if 'error' in entry:
+            raise ValueError(entry['error'])
+        if position:
+            raise ValueError('bump_target YAML path is duplicated')
+        first = entry
+    return first
+
+
+def yaml_index_cache_path(file_path):
+    return file_path.with_name(f'.{file_path.name}.bump-index.json')
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def load_yaml_index(file_path, text):
+    try:
+        cached = json.loads(yaml_index_cache_path(file_path).read_bytes())
+    except (OSError, ValueError):
+        return None
+    if (
+        not isinstance(cached, dict)
+        or cached.get('version') != YAML_INDEX_VERSION
+        or cached.get('sha256') != content_hash(text)
+    ):
+        return None
+    return cached['names'], cached['records']
+
+
+def save_yaml_index(file_path, text, index):
+    names, records = index
+    payload = {
+        'version': YAML_INDEX_VERSION,
+        'sha256': content_hash(text),
+        'names': names,
+        'records': records,
+    }
+    try:
+        atomic_write(
+            yaml_index_cache_path(file_path),
+            json.dumps(payload, separators=(',', ':')).encode(),
+            mode=stat.S_IMODE(file_path.stat().st_mode),
+        )
+    except OSError:
+        pass
+
+
+def cached_index_yaml(file_path, text, lines, index_cache):
+    index = load_yaml_index(file_path, text) if index_cache else None
+    if index is None:
+        index = index_yaml(lines)
+        if index_cache:
+            save_yaml_index(file_path, text, index)
+    return index
+
+
+def find_yaml_value(lines, keys, replacement=None, index=None):
+    if index is None:
+        index = index_yaml(lines)
+    entry = yaml_index_entry(lines, index, keys)
+    value = entry['value']
     if replacement is not None:
         if '\n' in replacement or '\r' in replacement:
             raise ValueError('bump_target value must be a single line')
+        quote = entry['quote']
         rendered = replacement
         if quote == '"':
             rendered = json.dumps(replacement)
@@ -125,61 +345,202 @@ def find_yaml_value(lines, keys, replacement=None):
                 'bump_target value must be a plain YAML-safe token; '
                 'quote the value in the target file to write other strings'
             )
-        lines[index] = (
-            match.group('indent')
-            + match.group('quote')
-            + match.group('key')
-            + match.group('quote')
-            + ':'
-            + match.group('space')
+        line = lines[entry['line']]
+        lines[entry['line']] = (
+            entry['prefix']
             + rendered
-            + trailing
+            + entry['trailing']
             + ('\n' if line.endswith('\n') else '')
         )
     return value
 
 
-def read_value(file_path, keys):
+def read_value(file_path, keys, index_cache=False):
     if file_path.suffix.lower() == '.json':
         return json_value(json.loads(file_path.read_text()), keys)
-    return find_yaml_value(file_path.read_text().splitlines(keepends=True), keys)
+    text = file_path.read_text()
+    lines = text.splitlines(keepends=True)
+    return find_yaml_value(lines, keys, index=cached_index_yaml(file_path, text, lines, index_cache))
 
 
-def write_value(file_path, keys, replacement):
-    if file_path.suffix.lower() == '.json':
-        data = json.loads(file_path.read_text())
-        parent = data
-        for key in keys[:-1]:
-            if not isinstance(parent, dict) or key not in parent:
-                raise ValueError(f'path component not found: {key}')
-            parent = parent[key]
-        if not isinstance(parent, dict) or keys[-1] not in parent:
-            raise ValueError(f'path component not found: {keys[-1]}')
-        if not isinstance(parent[keys[-1]], str):
-            raise ValueError('bump_target value must be a string')
-        parent[keys[-1]] = replacement
-        file_path.write_text(json.dumps(data, indent=2) + '\n')
+def write_value(file_path, keys, replacement, index_cache=False, expected=None):
+    file_path = file_path.resolve()
+    with locked_directory(file_path.parent):
+        if file_path.suffix.lower() == '.json':
+            text = file_path.read_bytes().decode()
+            start, end, current = json_string_span(text, keys)
+            check_expected(current, expected)
+            text = text[:start] + json.dumps(replacement) + text[end:]
+            if json.decoder.scanstring(text, start + 1)[0] != replacement:
+                raise ValueError('bump_target value did not round-trip')
+            atomic_write(file_path, text.encode())
+            return
+        text = file_path.read_bytes().decode()
+        lines = text.splitlines(keepends=True)
+        index = load_yaml_index(file_path, text) if index_cache else None
+        if index is None:
+            index = index_yaml(lines)
+        check_expected(find_yaml_value(lines, keys, index=index), expected)
+        find_yaml_value(lines, keys, replacement, index=index)
+        if find_yaml_value(lines, keys, index=index) != replacement:
+            raise ValueError('bump_target value did not round-trip')
+        text = ''.join(lines)
+        atomic_write(file_path, text.encode())
+        if index_cache:
+            save_yaml_index(file_path, text, index)
+
+
+SCAN_SUFFIXES = {'.json', '.yaml', '.yml'}
+SCAN_SKIPPED_DIRS = {'.git', 'node_modules'}
+SCAN_SKIPPED_FILES = {'package-lock.json', 'npm-shrinkwrap.json', 'yarn.lock'}
+SCAN_SKIPPED_FILE_SUFFIXES = ('-lock.yaml', '-lock.yml', '.bump-index.json')
+SCAN_SKIPPED_KEYS = {
+    'dependencies',
+    'devDependencies',
+    'optionalDependencies',
+    'peerDependencies',
+    'packages',
+}
+SCAN_VERSION_KEYS = {'appversion', 'imagetag', 'tag'}
+SCAN_IMAGE_KEYS = {'image', 'name', 'repository'}
+SCAN_VERSION_RE = re.compile(r'v?[0-9]+\.[0-9]+\.[0-9]+(?:[-+][0-9A-Za-z.+-]+)?')
+
+
+def scan_files(root):
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames if name not in SCAN_SKIPPED_DIRS)
+        for filename in sorted(filenames):
+            if filename in SCAN_SKIPPED_FILES or filename.endswith(SCAN_SKIPPED_FILE_SUFFIXES):
+                continue
+            file_path = Path(directory) / filename
+            if file_path.suffix.lower() in SCAN_SUFFIXES and not file_path.is_symlink():
+                yield file_path
+
+
+def json_scalars(value, parent=()):
+    if not isinstance(value, dict):
         return
-    lines = file_path.read_text().splitlines(keepends=True)
-    find_yaml_value(lines, keys, replacement)
-    file_path.write_text(''.join(lines))
+    siblings = {key: item for key, item in value.items() if isinstance(item, str)}
+    for key, item in value.items():
+        if isinstance(item, str):
+            yield parent + (key,), item, siblings
+        else:
+            yield from json_scalars(item, parent + (key,))
+
+
+def yaml_scalars(lines, index):
+    entries = {path: yaml_entry(lines, occurrences[0]) for path, occurrences in index.items()}
+    siblings = {}
+    for path, entry in entries.items():
+        if 'error' not in entry:
+            siblings.setdefault(path[:-1], {})[path[-1]] = entry['value']
+    for path, entry in entries.items():
+        if len(index[path]) == 1 and 'error' not in entry:
+            yield path, entry['value'], siblings[path[:-1]]
+
+
+def looks_like_lightdash_pin(keys, value, siblings):
+    if not SCAN_VERSION_RE.fullmatch(value):
+        return False
+    if any(key in SCAN_SKIPPED_KEYS for key in keys[:-1]):
+        return False
+    if 'lightdash' in keys[-1].lower():
+        return True
+    return keys[-1].lower() in SCAN_VERSION_KEYS and any(
+        key.lower() in SCAN_IMAGE_KEYS and 'lightdash' in sibling.lower()
+        for key, sibling in siblings.items()
+    )
+
+
+def scan_file(root, file_path, replacement=None, index_cache=False, expected=None):
+    try:
+        text = file_path.read_text()
+        if file_path.suffix.lower() == '.json':
+            scalars = list(json_scalars(json.loads(text)))
+        else:
+            lines = text.splitlines(keepends=True)
+            index = cached_index_yaml(file_path, text, lines, index_cache)
+            scalars = list(yaml_scalars(lines, yaml_paths(index)))
+    except (OSError, UnicodeDecodeError, ValueError):
+        return [], []
+    matches = []
+    failures = []
+    for keys, value, siblings in scalars:
+        if any(not key or '.' in key for key in keys):
+            continue
+        if not looks_like_lightdash_pin(keys, value, siblings):
+            continue
+        if expected is not None and value != expected:
+            continue
+        target = f"{file_path.relative_to(root).as_posix()}#{'.'.join(keys)}"
+        if replacement is not None:
+            try:
+                write_value(file_path, list(keys), replacement, index_cache, expected)
+            except (OSError, ValueError) as error:
+                failures.append((target, str(error)))
+                continue
+        matches.append((target, value))
+    return matches, failures
+
+
+def scan_tree(root, replacement=None, index_cache=False, jobs=None, expected=None):
+    matches = []
+    failures = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(scan_file, root, file_path, replacement, index_cache, expected): file_path
+            for file_path in scan_files(root)
+        }
+        for future, file_path in futures.items():
+            try:
+                file_matches, file_failures = future.result()
+            except Exception as error:
+                failures.append((file_path.relative_to(root).as_posix(), str(error)))
+                continue
+            matches.extend(file_matches)
+            failures.extend(file_failures)
+    return matches, failures
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('command', choices=['read', 'write'])
-    parser.add_argument('target')
+    parser.add_argument('command', choices=['read', 'write', 'scan'])
+    parser.add_argument('target', help='file#path.to.version, or the root directory to scan')
     parser.add_argument('value', nargs='?')
+    parser.add_argument(
+        '--index-cache',
+        action='store_true',
+        help='reuse a YAML key-path index cached next to the target file',
+    )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        help='number of scan worker processes (default: CPU count)',
+    )
+    parser.add_argument(
+        '--expect',
+        help='only write when the current value equals this value',
+    )
     args = parser.parse_args()
+    if args.command == 'scan':
+        root = Path(args.target)
+        if not root.is_dir():
+            raise ValueError('scan requires a directory')
+        matches, failures = scan_tree(root, args.value, args.index_cache, args.jobs, args.expect)
+        for target, value in matches:
+            print(f'{target}\t{value}')
+        for target, message in failures:
+            print(f'{target}\terror: {message}', file=sys.stderr)
+        if failures:
+            raise SystemExit(f'scan failed for {len(failures)} target(s)')
+        return
     file_path, keys = split_target(args.target)
     if args.command == 'read':
-        print(read_value(file_path, keys))
+        print(read_value(file_path, keys, args.index_cache))
         return
     if args.value is None:
         raise ValueError('write requires a value')
-    write_value(file_path, keys, args.value)
-    if read_value(file_path, keys) != args.value:
-        raise ValueError('bump_target value did not round-trip')
+    write_value(file_path, keys, args.value, args.index_cache, args.expect)
 
 
 if __name__ == '__main__':
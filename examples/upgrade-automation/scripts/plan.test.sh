@@ -869,3 +869,180 @@ run_auto_merge_test 'plan clean auto merge fallback' true failure CLEAN 0 true t
 run_auto_merge_test 'plan non-clean auto merge failure' true failure DIRTY 1 true true false true false
 run_auto_merge_test 'plan auto merge disabled' false success CLEAN 0 false false false false false
 run_auto_merge_test 'plan freeze before auto merge' true success CLEAN 0 false false false false true
+
+bump_dir="$test_dir/bump-target"
+mkdir -p "$bump_dir"
+bump_target() {
+    (cd "$bump_dir" && python3 "$root/examples/upgrade-automation/scripts/bump-target.py" "$@")
+}
+
+printf 'image:\n  tag: 1.0.0\n' >"$bump_dir/values.yml"
+
+set +e
+output=$(bump_target write values.yml#image.tag 2.0.0 --expect 1.0.5 2>&1)
+status=$?
+set -e
+
+if [[ $status -eq 0 ]]; then
+    printf 'expected a write with a mismatched --expect to fail\n' >&2
+    exit 1
+fi
+
+if [[ "$output" != *"bump_target value is '1.0.0', expected '1.0.5'"* ]]; then
+    printf 'expected a clear --expect mismatch message, got:\n%s\n' "$output" >&2
+    exit 1
+fi
+
+if [[ "$(bump_target read values.yml#image.tag)" != "1.0.0" ]]; then
+    printf 'expected a mismatched --expect to leave the file unchanged, got:\n%s\n' "$(cat "$bump_dir/values.yml")" >&2
+    exit 1
+fi
+
+bump_target write values.yml#image.tag 2.0.0 --expect 1.0.0
+if [[ "$(bump_target read values.yml#image.tag)" != "2.0.0" ]]; then
+    printf 'expected a matching --expect to write, got:\n%s\n' "$(cat "$bump_dir/values.yml")" >&2
+    exit 1
+fi
+
+printf 'bump-target expect mismatch test passed\n'
+
+for writer in 1 2 3 4 5 6 7 8; do
+    bump_target write values.yml#image.tag "3.0.$writer" >"$bump_dir/writer-$writer.log" 2>&1 &
+done
+failed_writers=0
+for writer_pid in $(jobs -p); do
+    wait "$writer_pid" || failed_writers=$((failed_writers + 1))
+done
+
+if [[ $failed_writers -ne 0 ]]; then
+    printf 'expected concurrent writes to all succeed, %s failed:\n%s\n' "$failed_writers" "$(cat "$bump_dir"/writer-*.log)" >&2
+    exit 1
+fi
+
+if [[ "$(bump_target read values.yml#image.tag)" != 3.0.[1-8] ]]; then
+    printf 'expected concurrent writes to leave one of their values, got:\n%s\n' "$(cat "$bump_dir/values.yml")" >&2
+    exit 1
+fi
+
+printf 'bump-target concurrent writes test passed\n'
+
+printf '# chart values\nimage:\n  repository: lightdash/lightdash\n  tag: 1.0.0  # pinned\n' >"$bump_dir/cached.yml"
+bump_index="$bump_dir/.cached.yml.bump-index.json"
+
+if [[ "$(bump_target read --index-cache cached.yml#image.tag)" != 1.0.0 || ! -f "$bump_index" ]]; then
+    printf 'expected an indexed read to return the value and save its index\n' >&2
+    exit 1
+fi
+
+if [[ "$(bump_target read --index-cache cached.yml#image.tag)" != 1.0.0 ]]; then
+    printf 'expected a cached read to return the value\n' >&2
+    exit 1
+fi
+
+sed -i 's/^# chart values$/# chart values\n# edited outside bump-target/; s/tag: 1.0.0/tag: 1.0.1/' "$bump_dir/cached.yml"
+if [[ "$(bump_target read --index-cache cached.yml#image.tag)" != 1.0.1 ]]; then
+    printf 'expected a read after an outside edit to re-index the file\n' >&2
+    exit 1
+fi
+
+bump_target write --index-cache cached.yml#image.tag 1.0.20
+if ! grep -qx '  tag: 1.0.20  # pinned' "$bump_dir/cached.yml"; then
+    printf 'expected a cached write to keep the trailing comment, got:\n%s\n' "$(cat "$bump_dir/cached.yml")" >&2
+    exit 1
+fi
+if ! python3 -c 'import json, sys; sys.exit(json.load(open(sys.argv[1]))["sha256"] != sys.argv[2])' \
+    "$bump_index" "$(sha256sum "$bump_dir/cached.yml" | cut -d' ' -f1)"; then
+    printf 'expected a cached write to save an index matching the new content\n' >&2
+    exit 1
+fi
+if [[ "$(bump_target read --index-cache cached.yml#image.tag)" != 1.0.20 ]]; then
+    printf 'expected a cached read after a cached write to return the new value\n' >&2
+    exit 1
+fi
+
+printf 'bump-target index cache test passed\n'
+
+cat >"$bump_dir/values.json" <<'EOF'
+{
+    "image" : { "tag":"1.0.0",   "note": "caf\u00e9 \"tag\": 1.0.0" },
+  "tags": ["1.0.0"],	"nested": {"image": {"tag": "1.0.0"}}
+}
+EOF
+sed 's/"tag":"1.0.0"/"tag":"1.0.2"/' "$bump_dir/values.json" >"$bump_dir/expected.json"
+
+bump_target write values.json#image.tag 1.0.2
+if ! cmp -s "$bump_dir/values.json" "$bump_dir/expected.json"; then
+    printf 'expected a JSON write to change only the target string, got:\n%s\n' "$(cat "$bump_dir/values.json")" >&2
+    exit 1
+fi
+
+printf 'bump-target JSON span test passed\n'
+
+scan_dir="$bump_dir/scan"
+mkdir -p "$scan_dir/chart" "$scan_dir/deploy" "$scan_dir/web" "$bump_dir/outside"
+cat >"$scan_dir/chart/values.yaml" <<'EOF'
+lightdash:
+  image:
+    repository: lightdash/lightdash
+    tag: 0.1500.0
+  postgresql:
+    image:
+      repository: bitnami/postgresql
+      tag: 15.4.0
+  headlessBrowser:
+    image:
+      repository: ghcr.io/browserless/chromium
+      tag: v2.18.0
+unrelated:
+  tag: 0.1500.0
+EOF
+cp "$scan_dir/chart/values.yaml" "$bump_dir/outside/values.yaml"
+ln -s ../../outside/values.yaml "$scan_dir/chart/linked.yaml"
+printf '{"lightdashVersion": "0.1500.0"}\n' >"$scan_dir/deploy/versions.json"
+printf '{"lightdashVersion": "0.1500.0"}\n' >"$scan_dir/deploy/.versions.json.bump-index.json"
+printf '{"name": "web", "dependencies": {"@lightdash/common": "0.1500.0"}}\n' >"$scan_dir/web/package.json"
+printf '{"packages": {"node_modules/@lightdash/common": {"version": "0.1500.0"}}}\n' >"$scan_dir/web/package-lock.json"
+for file in outside/values.yaml scan/deploy/.versions.json.bump-index.json scan/web/package.json scan/web/package-lock.json; do
+    cp "$bump_dir/$file" "$bump_dir/$file.orig"
+done
+
+expected_scan=$'chart/values.yaml#lightdash.image.tag\t0.1500.0\ndeploy/versions.json#lightdashVersion\t0.1500.0'
+output=$(bump_target scan scan)
+if [[ "$output" != "$expected_scan" ]]; then
+    printf 'expected scan to list only the Lightdash pins, got:\n%s\n' "$output" >&2
+    exit 1
+fi
+
+output=$(bump_target scan scan 0.1600.0)
+if [[ "$output" != "$expected_scan" ]]; then
+    printf 'expected scan with a value to report the rewritten targets, got:\n%s\n' "$output" >&2
+    exit 1
+fi
+
+if [[ "$(bump_target read scan/chart/values.yaml#lightdash.image.tag)" != "0.1600.0" ]] ||
+    [[ "$(bump_target read scan/chart/values.yaml#lightdash.postgresql.image.tag)" != "15.4.0" ]] ||
+    [[ "$(bump_target read scan/chart/values.yaml#lightdash.headlessBrowser.image.tag)" != "v2.18.0" ]] ||
+    [[ "$(bump_target read scan/chart/values.yaml#unrelated.tag)" != "0.1500.0" ]] ||
+    [[ "$(bump_target read scan/deploy/versions.json#lightdashVersion)" != "0.1600.0" ]]; then
+    printf 'expected scan to rewrite only the Lightdash pins, got:\n%s\n' "$(cat "$scan_dir/chart/values.yaml")" >&2
+    exit 1
+fi
+
+for file in outside/values.yaml scan/deploy/.versions.json.bump-index.json scan/web/package.json scan/web/package-lock.json; do
+    if ! cmp -s "$bump_dir/$file" "$bump_dir/$file.orig"; then
+        printf 'expected scan to leave %s alone\n' "$file" >&2
+        exit 1
+    fi
+done
+
+set +e
+output=$(bump_target scan scan 'not a token' 2>&1)
+status=$?
+set -e
+
+if [[ $status -eq 0 || "$output" != *'chart/values.yaml#lightdash.image.tag	error: bump_target value must be a plain YAML-safe token'* ]]; then
+    printf 'expected scan to report the target it could not write and fail, got status %s:\n%s\n' "$status" "$output" >&2
+    exit 1
+fi
+
+printf 'bump-target scan test passed\n'
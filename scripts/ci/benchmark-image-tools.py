@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""Benchmark the docker-build-test tools offline, on synthetic inputs.
+
+    benchmark-image-tools.py [--files N] [--log-steps N] [--output results.json]
+                             [--compare previous.json]
+
+Generates a rootfs tar stream, a BuildKit plain-progress log and a pair of
+artifact directories at the requested scale, then runs each tool against them
+as CI does (`image-artifacts.py manifest`, `manifest --verify-against`,
+`buildlog`, and `compare-image-builds.py`). Each tool runs in its own process,
+so wall time and peak RSS are the tool's own. Results are written as JSON, and
+`--compare` prints the change against a previous results file. Run it on two
+revisions with the same flags to measure a performance change.
+"""
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_ARTIFACTS = os.path.join(SCRIPTS_DIR, "image-artifacts.py")
+COMPARE_IMAGE_BUILDS = os.path.join(SCRIPTS_DIR, "compare-image-builds.py")
+
+MANIFEST_HEADER = "path\ttype\tmode\tuid\tgid\tsize\tsha256\tlink"
+
+# Directory names the synthetic rootfs spreads its files over.
+ROOTFS_DIRS = ("usr/lib", "usr/bin", "usr/app/node_modules", "opt/venvs/dbt", "etc", "var/lib")
+BUILD_STAGES = ("base", "prod-builder", "build-backend", "build-frontend", "duckdb-extensions", "build-final")
+ANSI_BLUE = "\x1b[34m"
+ANSI_RESET = "\x1b[0m"
+
+
+def file_sizes(rng, count, median_size, sigma):
+    """Log-normal sizes: most files are small, a few are very large, like a real image."""
+    return [max(0, int(rng.lognormvariate(0, sigma) * median_size)) for _ in range(count)]
+
+
+def synthetic_paths(rng, count):
+    return [
+        f"{rng.choice(ROOTFS_DIRS)}/pkg{index // 50:05d}/file{index:07d}.{rng.choice(('js', 'py', 'so', 'json'))}"
+        for index in range(count)
+    ]
+
+
+def open_rootfs(path, names):
+    """Open a `docker export`-shaped tar and write the directories holding names."""
+    tar = tarfile.open(path, "w", format=tarfile.GNU_FORMAT)
+    for directory in sorted({os.path.dirname(name) for name in names}):
+        info = tarfile.TarInfo(directory)
+        info.type = tarfile.DIRTYPE
+        info.mode = 0o755
+        tar.addfile(info)
+    return tar
+
+
+def add_rootfs_file(tar, name, content):
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    info.mode = 0o644
+    tar.addfile(info, io.BytesIO(content))
+
+
+def add_rootfs_symlinks(tar, symlinks):
+    for name, target in symlinks:
+        info = tarfile.TarInfo(name)
+        info.type = tarfile.SYMTYPE
+        info.linkname = target
+        tar.addfile(info)
+
+
+def generate_rootfs_pair(rng, directory, files, median_size, sigma, diff_ratio):
+    """Write baseline and candidate rootfs tars; diff_ratio of the files differ.
+
+    Both tars are written side by side as each file's content is generated, so
+    only one file is held in memory at a time.
+    """
+    paths = synthetic_paths(rng, files)
+    sizes = file_sizes(rng, files, median_size, sigma)
+    symlinks = [(f"{path}.link", os.path.basename(path)) for path in paths[:: max(1, files // 100)]]
+    changed = set(rng.sample(range(files), int(files * diff_ratio)))
+    names = paths + [name for name, _ in symlinks]
+
+    baseline_tar = os.path.join(directory, "baseline-rootfs.tar")
+    candidate_tar = os.path.join(directory, "candidate-rootfs.tar")
+    with open_rootfs(baseline_tar, names) as baseline, open_rootfs(candidate_tar, names) as candidate:
+        for index, (path, size) in enumerate(zip(paths, sizes)):
+            content = rng.randbytes(size)
+            add_rootfs_file(baseline, path, content)
+            if index in changed:
+                # Half keep their size, so verification has to hash them to notice.
+                if index % 2 and content:
+                    content = bytes([content[0] ^ 0xFF]) + content[1:]
+                else:
+                    content += b"\n"
+            add_rootfs_file(candidate, path, content)
+        add_rootfs_symlinks(baseline, symlinks)
+        add_rootfs_symlinks(candidate, symlinks)
+    return baseline_tar, candidate_tar, os.path.getsize(baseline_tar)
+
+
+def generate_buildlog(rng, path, steps, lines_per_step, cached_ratio):
+    """Write a BuildKit `--progress plain` log with ANSI colour, like build.log."""
+    lines = 0
+    with open(path, "w", encoding="utf-8") as handle:
+        for vertex in range(1, steps + 1):
+            stage = BUILD_STAGES[vertex % len(BUILD_STAGES)]
+            handle.write(f"{ANSI_BLUE}#{vertex} [{stage} {vertex % 12 + 1:>2}/12] RUN step {vertex}{ANSI_RESET}\n")
+            lines += 1
+            if rng.random() < cached_ratio:
+                handle.write(f"#{vertex} CACHED\n")
+                lines += 1
+                continue
+            for line in range(lines_per_step):
+                handle.write(f"#{vertex} {line * 0.013:.3f} output line {line} of step {vertex}\n")
+            handle.write(f"#{vertex} DONE {rng.uniform(0.01, 120):.1f}s\n")
+            lines += lines_per_step + 1
+    return lines, os.path.getsize(path)
+
+
+def write_artifact_dir(directory, rows):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "image-config.json"), "w", encoding="utf-8") as handle:
+        json.dump({"architecture": "amd64", "os": "linux", "config": {"Cmd": ["node"]}}, handle)
+    with gzip.open(os.path.join(directory, "fs-manifest.tsv.gz"), "wt", encoding="utf-8") as handle:
+        handle.write(MANIFEST_HEADER + "\n")
+        for row in rows:
+            handle.write("\t".join(row) + "\n")
+
+
+def generate_manifest_pair(rng, directory, entries, diff_ratio):
+    """Write baseline and candidate artifact directories with synthetic manifests."""
+    rows = []
+    for path in sorted(synthetic_paths(rng, entries)):
+        size = str(rng.randint(0, 1 << 20))
+        rows.append(("/" + path, "file", "0644", "0", "0", size, hashlib.sha256(path.encode()).hexdigest(), "-"))
+
+    candidate = list(rows)
+    for index in rng.sample(range(entries), int(entries * diff_ratio)):
+        row = list(candidate[index])
+        row[6] = hashlib.sha256(row[6].encode()).hexdigest()
+        candidate[index] = tuple(row)
+
+    baseline_dir = os.path.join(directory, "baseline")
+    candidate_dir = os.path.join(directory, "candidate")
+    write_artifact_dir(baseline_dir, rows)
+    write_artifact_dir(candidate_dir, candidate)
+    return baseline_dir, candidate_dir
+
+
+def generate_inputs(args, work):
+    """Write every synthetic input under work and describe them."""
+    rng = random.Random(args.seed)
+    baseline_tar, candidate_tar, tar_bytes = generate_rootfs_pair(
+        rng, work, args.files, args.median_size, args.size_sigma, args.diff_ratio
+    )
+    log_path = os.path.join(work, "build.log")
+    log_lines, log_bytes = generate_buildlog(rng, log_path, args.log_steps, args.log_lines_per_step, args.cached_ratio)
+    baseline_dir, candidate_dir = generate_manifest_pair(
+        rng, os.path.join(work, "artifacts"), args.manifest_entries, args.diff_ratio
+    )
+    return {
+        "baseline_tar": baseline_tar,
+        "candidate_tar": candidate_tar,
+        "tar_bytes": tar_bytes,
+        "log_path": log_path,
+        "log_lines": log_lines,
+        "log_bytes": log_bytes,
+        "baseline_dir": baseline_dir,
+        "candidate_dir": candidate_dir,
+    }
+
+
+def maxrss_mb(usage):
+    """Convert an rusage ru_maxrss, in bytes on macOS and in kilobytes elsewhere, to MB."""
+    return usage.ru_maxrss / (1024 * 1024) if sys.platform == "darwin" else usage.ru_maxrss / 1024
+
+
+def run_tool(command, stdin_path=None, ok_codes=(0,)):
+    """Run one tool invocation and return its wall time and peak RSS."""
+    stdin = open(stdin_path, "rb") if stdin_path else subprocess.DEVNULL
+    try:
+        started = time.perf_counter()
+        process = subprocess.Popen(command, stdin=stdin, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        stderr = process.stderr.read()
+        # wait4 reports the rusage of this child alone, unlike RUSAGE_CHILDREN.
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - started
+    finally:
+        if stdin_path:
+            stdin.close()
+    code = os.waitstatus_to_exitcode(status)
+    process.returncode = code
+    if code not in ok_codes:
+        sys.exit(f"{' '.join(command)} exited {code}:\n{stderr.decode(errors='replace')}")
+    return elapsed, maxrss_mb(usage)
+
+
+def benchmark(name, command, repeat, units, unit_name, stdin_path=None, ok_codes=(0,)):
+    """Best of `repeat` runs; the fastest run is the least disturbed by the host."""
+    runs = [run_tool(command, stdin_path, ok_codes) for _ in range(repeat)]
+    seconds = min(elapsed for elapsed, _ in runs)
+    result = {
+        "benchmark": name,
+        "seconds": round(seconds, 4),
+        "throughput": round(units / seconds, 1) if seconds else None,
+        "throughput_unit": f"{unit_name}/s",
+        "peak_rss_mb": round(max(peak for _, peak in runs), 1),
+    }
+    print(
+        f"  {name:<24} {result['seconds']:>9.3f}s {result['throughput']:>14,.0f} {result['throughput_unit']:<12}"
+        f" {result['peak_rss_mb']:>9.1f} MB",
+        file=sys.stderr,
+    )
+    return result
+
+
+def print_comparison(previous, current):
+    before = {result["benchmark"]: result for result in previous["results"]}
+    if previous.get("scale") != current["scale"]:
+        print("  note: the previous results were recorded at a different scale", file=sys.stderr)
+    print(f"\n  {'benchmark':<24} {'before s':>9} {'after s':>9} {'change':>8} {'before MB':>10} {'after MB':>9}", file=sys.stderr)
+    for result in current["results"]:
+        old = before.get(result["benchmark"])
+        if old is None:
+            continue
+        change = (result["seconds"] - old["seconds"]) / old["seconds"] * 100 if old["seconds"] else 0.0
+        print(
+            f"  {result['benchmark']:<24} {old['seconds']:>9.3f} {result['seconds']:>9.3f} {change:>+7.1f}%"
+            f" {old['peak_rss_mb']:>10.1f} {result['peak_rss_mb']:>9.1f}",
+            file=sys.stderr,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=20000, help="regular files in the synthetic rootfs")
+    parser.add_argument("--median-size", type=int, default=4096, help="median file size in bytes")
+    parser.add_argument("--size-sigma", type=float, default=1.5, help="log-normal spread of file sizes")
+    parser.add_argument("--diff-ratio", type=float, default=0.01, help="fraction of files/entries that differ")
+    parser.add_argument("--log-steps", type=int, default=2000, help="BuildKit vertices in the synthetic log")
+    parser.add_argument("--log-lines-per-step", type=int, default=50, help="output lines per uncached vertex")
+    parser.add_argument("--cached-ratio", type=float, default=0.6, help="fraction of vertices reported CACHED")
+    parser.add_argument("--manifest-entries", type=int, default=200000, help="entries per synthetic manifest")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark; the fastest is reported")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the synthetic inputs")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", metavar="PREVIOUS", help="results JSON from another revision")
+    args = parser.parse_args()
+
+    scale = {
+        key: getattr(args, key)
+        for key in (
+            "files",
+            "median_size",
+            "size_sigma",
+            "diff_ratio",
+            "log_steps",
+            "log_lines_per_step",
+            "cached_ratio",
+            "manifest_entries",
+            "seed",
+        )
+    }
+    python = sys.executable
+    results = []
+    with tempfile.TemporaryDirectory(prefix="image-tools-bench-") as work:
+        print("Generating synthetic inputs...", file=sys.stderr)
+        # A forked child starts with its parent's RSS as its high-water mark, so the
+        # inputs are built in a throwaway process to keep this one small.
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            inputs = executor.submit(generate_inputs, args, work).result()
+        baseline_tar, candidate_tar = inputs["baseline_tar"], inputs["candidate_tar"]
+        tar_bytes, log_path, log_lines = inputs["tar_bytes"], inputs["log_path"], inputs["log_lines"]
+        baseline_dir, candidate_dir = inputs["baseline_dir"], inputs["candidate_dir"]
+        baseline_manifest = os.path.join(work, "baseline-manifest.tsv.gz")
+        run_tool([python, IMAGE_ARTIFACTS, "manifest", "--output", baseline_manifest], baseline_tar)
+
+        print(f"Benchmarking ({args.repeat} run(s) each, fastest reported)...", file=sys.stderr)
+        megabytes = tar_bytes / 1e6
+        results.append(benchmark(
+            "manifest",
+            [python, IMAGE_ARTIFACTS, "manifest", "--output", os.path.join(work, "manifest.tsv.gz")],
+            args.repeat, megabytes, "MB", stdin_path=candidate_tar,
+        ))
+        results.append(benchmark(
+            "manifest-verify",
+            [python, IMAGE_ARTIFACTS, "manifest", "--verify-against", baseline_manifest],
+            args.repeat, megabytes, "MB", stdin_path=candidate_tar, ok_codes=(0, 1),
+        ))
+        results.append(benchmark(
+            "manifest-verify-identical",
+            [python, IMAGE_ARTIFACTS, "manifest", "--verify-against", baseline_manifest],
+            args.repeat, megabytes, "MB", stdin_path=baseline_tar,
+        ))
+        results.append(benchmark(
+            "buildlog",
+            [python, IMAGE_ARTIFACTS, "buildlog", "--log", log_path, "--output", os.path.join(work, "timing.json")],
+            args.repeat, log_lines, "lines",
+        ))
+        results.append(benchmark(
+            "compare-image-builds",
+            [python, COMPARE_IMAGE_BUILDS, baseline_dir, candidate_dir],
+            args.repeat, args.manifest_entries, "entries", ok_codes=(0, 1),
+        ))
+
+    report = {
+        "python": sys.version.split()[0],
+        "scale": scale,
+        "inputs": {
+            "rootfs_tar_bytes": tar_bytes,
+            "buildlog_lines": log_lines,
+            "buildlog_bytes": inputs["log_bytes"],
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+            handle.write("\n")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as handle:
+            print_comparison(json.load(handle), report)
+    print(json.dumps(report["results"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,17 +4,21 @@
 Subcommands:
   config    normalise `docker image inspect` output into a stable config JSON
   manifest  read a `docker export` tar stream on stdin, emit a sorted fs manifest
-  buildlog  parse a `--progress plain` BuildKit log into timing + cache stats
+            and/or verify it against a baseline manifest as it streams
+  buildlog  parse `--progress plain` BuildKit logs (plain or gzip) into timing +
+            cache stats; several logs combine into one dataset
 """
 
 import argparse
 import gzip
 import hashlib
 import json
+import os
 import re
 import sys
 import tarfile
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 # Fields that describe what the image *is*. Everything else reported by
 # `docker image inspect` (Id, Created, RepoTags, RootFS layer digests, GraphDriver)
@@ -58,6 +62,10 @@ TAR_TYPES = {
 }
 
 MANIFEST_HEADER = "path\ttype\tmode\tuid\tgid\tsize\tsha256\tlink"
+MANIFEST_FIELDS = MANIFEST_HEADER.split("\t")[1:]
+# Names compare-image-builds.py looks for in an artifact directory.
+MANIFEST_CANDIDATES = ("fs-manifest.tsv.gz", "fs-manifest.tsv")
+SHA256_INDEX = MANIFEST_FIELDS.index("sha256") + 1
 
 
 def normalise_path(name):
@@ -100,9 +108,56 @@ def cmd_config(args):
         handle.write("\n")
 
 
+def load_manifest_index(path):
+    """Index a baseline manifest (file or artifact directory) by path."""
+    if os.path.isdir(path):
+        directory = path
+        names = [os.path.join(directory, name) for name in MANIFEST_CANDIDATES]
+        path = next((name for name in names if os.path.exists(name)), None)
+        if path is None:
+            sys.exit(f"no filesystem manifest found in {directory}")
+    opener = gzip.open if path.endswith(".gz") else open
+    index = {}
+    with opener(path, "rt", encoding="utf-8") as handle:
+        if handle.readline().rstrip("\n") != MANIFEST_HEADER:
+            sys.exit(f"{path} is not a filesystem manifest")
+        for line in handle:
+            row = tuple(line.rstrip("\n").split("\t"))
+            index[row[0]] = row
+    return index
+
+
+def hash_member(tar, member):
+    stream = tar.extractfile(member)
+    if stream is None:
+        return "-"
+    hasher = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def changed_fields(before, after):
+    """Fields that differ between two manifest rows, leaving the digest to the caller."""
+    return [
+        field
+        for offset, field in enumerate(MANIFEST_FIELDS, start=1)
+        if field != "sha256" and before[offset] != after[offset]
+    ]
+
+
 def cmd_manifest(args):
+    if not args.output and not args.verify_against:
+        sys.exit("manifest needs --output, --verify-against, or both")
+
+    baseline = load_manifest_index(args.verify_against) if args.verify_against else None
+    waived = tuple(args.ignore_path_prefix)
+    differences = []
     rows = []
+    entries = 0
+    total_file_bytes = 0
     skipped = 0
+    stopped_early = False
     # Stream mode ("r|"): the tar is consumed once, forwards only, so nothing is
     # buffered to disk. A multi-GB image never lands on the runner twice.
     with tarfile.open(fileobj=sys.stdin.buffer, mode="r|*") as tar:
@@ -112,48 +167,80 @@ def cmd_manifest(args):
                 skipped += 1
                 continue
 
-            kind = TAR_TYPES.get(member.type, "other")
-            digest = "-"
             size = member.size if member.isreg() else 0
-            if member.isreg():
-                stream = tar.extractfile(member)
-                if stream is not None:
-                    hasher = hashlib.sha256()
-                    for chunk in iter(lambda: stream.read(1024 * 1024), b""):
-                        hasher.update(chunk)
-                    digest = hasher.hexdigest()
-
-            rows.append(
-                (
-                    path,
-                    kind,
-                    format(member.mode & 0o7777, "04o"),
-                    str(member.uid),
-                    str(member.gid),
-                    str(size),
-                    digest,
-                    member.linkname or "-",
-                )
-            )
-
-    rows.sort(key=lambda row: row[0])
-    opener = gzip.open if args.output.endswith(".gz") else open
-    with opener(args.output, "wt", encoding="utf-8") as handle:
-        handle.write(MANIFEST_HEADER + "\n")
-        for row in rows:
-            handle.write("\t".join(row) + "\n")
+            row = [
+                path,
+                TAR_TYPES.get(member.type, "other"),
+                format(member.mode & 0o7777, "04o"),
+                str(member.uid),
+                str(member.gid),
+                str(size),
+                "-",
+                member.linkname or "-",
+            ]
+            entries += 1
+            total_file_bytes += size
+
+            # Compare the cheap metadata first; content is only hashed when it
+            # can still decide the verdict or the manifest itself is wanted.
+            expected = None
+            fields = []
+            if baseline is not None and not stopped_early and not path.startswith(waived):
+                expected = baseline.pop(path, None)
+                if expected is None:
+                    differences.append(("+", path, []))
+                else:
+                    fields = changed_fields(expected, row)
+            if member.isreg() and (args.output or (expected is not None and not fields)):
+                row[SHA256_INDEX] = hash_member(tar, member)
+            if expected is not None and row[SHA256_INDEX] not in ("-", expected[SHA256_INDEX]):
+                fields.append("sha256")
+            if fields:
+                differences.append(("~", path, fields))
+
+            if args.output:
+                rows.append(tuple(row))
+            if differences and args.fail_fast and not stopped_early:
+                stopped_early = True
+                # The manifest must still list every entry, so only stop
+                # reading when nothing but the verdict was asked for.
+                if not args.output:
+                    break
+
+    if baseline is not None and not stopped_early:
+        differences.extend(("-", path, []) for path in sorted(baseline) if not path.startswith(waived))
+
+    if args.output:
+        rows.sort(key=lambda row: row[0])
+        opener = gzip.open if args.output.endswith(".gz") else open
+        with opener(args.output, "wt", encoding="utf-8") as handle:
+            handle.write(MANIFEST_HEADER + "\n")
+            for row in rows:
+                handle.write("\t".join(row) + "\n")
 
     summary = {
-        "entries": len(rows),
+        "entries": entries,
         "runtime_injected_skipped": skipped,
-        "total_file_bytes": sum(int(row[5]) for row in rows),
+        "total_file_bytes": total_file_bytes,
     }
+    if baseline is not None:
+        summary["verified_against"] = args.verify_against
+        summary["identical"] = not differences
+        summary["differences"] = len(differences)
+        summary["stopped_early"] = stopped_early
     if args.summary:
         with open(args.summary, "w", encoding="utf-8") as handle:
             json.dump(summary, handle, indent=2)
             handle.write("\n")
     print(json.dumps(summary), file=sys.stderr)
 
+    if differences:
+        for marker, path, fields in differences[: args.max_lines]:
+            print(f"  {marker} {path}" + (f"  ({', '.join(fields)})" if fields else ""))
+        if len(differences) > args.max_lines:
+            print(f"  ... and {len(differences) - args.max_lines} more (raise --max-lines to see them)")
+        sys.exit(1)
+
 
 VERTEX_NAME_RE = re.compile(r"^#(\d+) \[([^\]]*)\] (.*)$")
 VERTEX_DONE_RE = re.compile(r"^#(\d+) DONE ([0-9.]+)s$")
@@ -167,12 +254,32 @@ ANSI_RE = re.compile(r"\x1b\[[0-9;]*m")
 STAGE_RE = re.compile(r"^(.*?)\s*(?:(\d+)/(\d+))?$")
 
 
-def cmd_buildlog(args):
+def open_log(path):
+    """Open a build log as text, transparently gunzipping archived ones."""
+    with open(path, "rb") as handle:
+        compressed = handle.read(2) == b"\x1f\x8b"
+    if compressed:
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def parse_buildlog(path):
+    """Return the build steps of one log, in the order BuildKit started them."""
     steps = {}
     order = []
-    with open(args.log, "r", encoding="utf-8", errors="replace") as handle:
+    with open_log(path) as handle:
         for line in handle:
-            line = ANSI_RE.sub("", line.rstrip("\n"))
+            line = line.rstrip("\n")
+            if "\x1b" in line:
+                line = ANSI_RE.sub("", line)
+            # Every line we care about is "#<vertex> " followed by "[", "CACHED",
+            # "DONE" or "ERROR"; the bulk of a log is "#<vertex> <elapsed> ..."
+            # command output, so reject on the first character before any regex.
+            if not line.startswith("#"):
+                continue
+            space = line.find(" ")
+            if space < 0 or line[space + 1 : space + 2] not in ("[", "C", "D", "E"):
+                continue
 
             match = VERTEX_NAME_RE.match(line)
             if match:
@@ -209,7 +316,11 @@ def cmd_buildlog(args):
             if match and match.group(1) in steps:
                 steps[match.group(1)]["error"] = match.group(2)
 
-    ordered = [steps[vertex] for vertex in order]
+    return [steps[vertex] for vertex in order]
+
+
+def summarise_steps(ordered):
+    """Build the totals and per-stage breakdown for a list of steps."""
     per_stage = defaultdict(lambda: {"seconds": 0.0, "steps": 0, "cached": 0})
     for step in ordered:
         bucket = per_stage[step["stage"]]
@@ -218,25 +329,62 @@ def cmd_buildlog(args):
         bucket["cached"] += 1 if step["cached"] else 0
 
     cached = sum(1 for step in ordered if step["cached"])
-    result = {
-        "wall_clock_seconds": args.wall_clock,
-        "totals": {
-            "steps": len(ordered),
-            "cache_hits": cached,
-            "cache_misses": len(ordered) - cached,
-            "cache_hit_ratio": round(cached / len(ordered), 4) if ordered else 0.0,
-            "sum_step_seconds": round(sum(s["seconds"] or 0.0 for s in ordered), 2),
-        },
-        "per_stage": {
-            stage: {
-                "steps": data["steps"],
-                "cached": data["cached"],
-                "seconds": round(data["seconds"], 2),
-            }
-            for stage, data in sorted(per_stage.items(), key=lambda kv: -kv[1]["seconds"])
-        },
-        "steps": ordered,
+    totals = {
+        "steps": len(ordered),
+        "cache_hits": cached,
+        "cache_misses": len(ordered) - cached,
+        "cache_hit_ratio": round(cached / len(ordered), 4) if ordered else 0.0,
+        "sum_step_seconds": round(sum(s["seconds"] or 0.0 for s in ordered), 2),
     }
+    stages = {
+        stage: {
+            "steps": data["steps"],
+            "cached": data["cached"],
+            "seconds": round(data["seconds"], 2),
+        }
+        for stage, data in sorted(per_stage.items(), key=lambda kv: -kv[1]["seconds"])
+    }
+    return totals, stages
+
+
+def cmd_buildlog(args):
+    logs = args.log + args.logs
+    if not logs:
+        sys.exit("buildlog: pass at least one log (--log PATH or positional paths)")
+
+    if len(logs) == 1 or args.jobs == 1:
+        parsed = [parse_buildlog(path) for path in logs]
+    else:
+        # Each log is independent, so archived builds are parsed across workers.
+        jobs = args.jobs or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            parsed = list(executor.map(parse_buildlog, logs, chunksize=max(1, len(logs) // (4 * jobs))))
+
+    if len(logs) == 1:
+        # The single-build shape the docker-build-test job summary reads.
+        totals, per_stage = summarise_steps(parsed[0])
+        result = {
+            "wall_clock_seconds": args.wall_clock,
+            "totals": totals,
+            "per_stage": per_stage,
+            "steps": parsed[0],
+        }
+    else:
+        # Combined dataset: totals and per_stage span every build, and each build
+        # keeps its own totals and steps so it can be looked at on its own.
+        totals, per_stage = summarise_steps([step for ordered in parsed for step in ordered])
+        builds = []
+        for path, ordered in zip(logs, parsed):
+            build_totals, _ = summarise_steps(ordered)
+            builds.append({"log": path, "totals": build_totals, "steps": ordered})
+        result = {
+            "wall_clock_seconds": args.wall_clock,
+            "logs": len(logs),
+            "totals": totals,
+            "per_stage": per_stage,
+            "builds": builds,
+        }
+
     with open(args.output, "w", encoding="utf-8") as handle:
         json.dump(result, handle, indent=2)
         handle.write("\n")
@@ -252,14 +400,39 @@ def main():
     config.set_defaults(func=cmd_config)
 
     manifest = sub.add_parser("manifest", help="build an fs manifest from a docker export tar on stdin")
-    manifest.add_argument("--output", required=True, help="path; .gz suffix enables gzip")
+    manifest.add_argument("--output", help="path; .gz suffix enables gzip")
     manifest.add_argument("--summary", help="optional JSON summary path")
+    manifest.add_argument(
+        "--verify-against",
+        metavar="BASELINE",
+        help="baseline manifest or artifact directory; exit 1 if the stream differs from it",
+    )
+    manifest.add_argument(
+        "--ignore-path-prefix",
+        action="append",
+        default=[],
+        metavar="PREFIX",
+        help="waive verification differences under PREFIX (repeatable)",
+    )
+    manifest.add_argument(
+        "--fail-fast",
+        action="store_true",
+        help="stop verifying at the first non-waived difference; without --output, stop reading too",
+    )
+    manifest.add_argument("--max-lines", type=int, default=60, help="cap on differences printed")
     manifest.set_defaults(func=cmd_manifest)
 
-    buildlog = sub.add_parser("buildlog", help="parse a BuildKit plain-progress log")
-    buildlog.add_argument("--log", required=True)
+    buildlog = sub.add_parser("buildlog", help="parse BuildKit plain-progress logs (plain or gzip)")
+    buildlog.add_argument("logs", nargs="*", metavar="LOG", help="more logs to combine into one dataset")
+    buildlog.add_argument("--log", action="append", default=[], help="log path (repeatable)")
     buildlog.add_argument("--output", required=True)
     buildlog.add_argument("--wall-clock", type=float, default=None)
+    buildlog.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="worker processes when combining several logs (default: CPU count)",
+    )
     buildlog.set_defaults(func=cmd_buildlog)
 
     args = parser.parse_args()